@@ -5,45 +5,103 @@ Run on system startup: sync the last 30 days of attendance logs
 to the API using sync_all.py logic.
 """
 
+import atexit
 import subprocess
 import datetime
 import os
 import sys
-import json
 import logging
 import time
 import socket
+import queue
+import random
+import threading
+from collections import deque
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from pathlib import Path
+import httpx
 from telegram_notifier import TelegramNotifier
+from config import read_config
 
 # ------------- Logging -------------
-logging.basicConfig(
-    level=logging.INFO,
-    format="%(asctime)s - %(levelname)s - %(message)s",
-    datefmt="%Y-%m-%d %H:%M:%S",
-)
+def setup_logging() -> QueueListener:
+    """
+    Route all records through a QueueHandler; a background QueueListener
+    does the formatting and writes to the console and logs/boot_sync.log.
+    """
+    formatter = logging.Formatter(
+        "%(asctime)s - %(levelname)s - %(message)s",
+        datefmt="%Y-%m-%d %H:%M:%S",
+    )
+    log_dir = Path("logs")
+    log_dir.mkdir(parents=True, exist_ok=True)
+    file_handler = RotatingFileHandler(
+        log_dir / "boot_sync.log", maxBytes=5 * 1024 * 1024, backupCount=3, encoding="utf-8"
+    )
+    file_handler.setFormatter(formatter)
+    console = logging.StreamHandler()
+    console.setFormatter(formatter)
+
+    log_q: "queue.Queue" = queue.Queue(-1)
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    root.handlers[:] = [QueueHandler(log_q)]
+    listener = QueueListener(log_q, console, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+setup_logging()
 logger = logging.getLogger("BootSync30d")
 
 # ------------- Helpers -------------
 
 def load_telegram_config():
     try:
-        with open("config.json", "r") as f:
-            cfg = json.load(f)
-        return cfg
+        return read_config()
     except Exception as e:
         logger.error(f"Failed to load config.json: {e}")
         return {}
 
+# Telegram messages are sent by a background thread so the sync is never
+# blocked on api.telegram.org; tg_flush() must run before exiting.
+_TG_Q: "queue.Queue" = queue.Queue()
+_TG_THREAD = None
+
+def _tg_worker(notifier: "TelegramNotifier"):
+    with httpx.Client(timeout=10.0) as client:
+        while True:
+            item = _TG_Q.get()
+            if item is None:
+                return
+            html, retries, backoff_s = item
+            for i in range(retries):
+                if notifier.send_message_with_client(client, html):
+                    break
+                if i + 1 < retries:
+                    delay = random.uniform(0, backoff_s * 2 ** i)
+                    logger.error(f"Telegram send failed (attempt {i+1}/{retries}); retrying in {delay:.1f}s")
+                    time.sleep(delay)
+            else:
+                logger.error(f"Telegram send failed after {retries} attempts")
+
 def tg_send_safe(notifier: "TelegramNotifier", html: str, retries: int = 3, backoff_s: int = 2):
+    global _TG_THREAD
     if not notifier or not getattr(notifier, "enabled", False):
         return
-    for i in range(retries):
-        try:
-            notifier.send_message_sync(html)
-            return
-        except Exception as e:
-            logger.error(f"Telegram send failed (attempt {i+1}/{retries}): {e}")
-            time.sleep(backoff_s * (i + 1))
+    if _TG_THREAD is None:
+        _TG_THREAD = threading.Thread(target=_tg_worker, args=(notifier,), name="tg-sender", daemon=True)
+        _TG_THREAD.start()
+    _TG_Q.put((html, retries, backoff_s))
+
+def tg_flush(timeout_s: float = 30):
+    """Wait (bounded) for queued Telegram messages to be sent."""
+    if _TG_THREAD is None:
+        return
+    _TG_Q.put(None)
+    _TG_THREAD.join(timeout_s)
+    if _TG_THREAD.is_alive():
+        logger.warning("Telegram sender still busy at exit; remaining messages dropped.")
 
 def tg_send_with_name(notifier: "TelegramNotifier", message: str, retries: int = 3, backoff_s: int = 2):
     """
@@ -58,18 +116,79 @@ def tg_send_with_name(notifier: "TelegramNotifier", message: str, retries: int =
     tg_send_safe(notifier, message, retries, backoff_s)
 
 def wait_for_network(max_wait_s: int = 120) -> bool:
-    """Wait until DNS & outbound connectivity work (best-effort)."""
-    start = time.time()
-    while time.time() - start < max_wait_s:
+    """
+    Wait until DNS & outbound connectivity work (best-effort).
+    One connect to api.telegram.org:443 per try covers both: a single
+    name lookup plus a TCP handshake to a host we actually talk to.
+    """
+    deadline = time.monotonic() + max_wait_s
+    while time.monotonic() < deadline:
         try:
-            socket.gethostbyname("api.telegram.org")
-            socket.gethostbyname("google.com")
-            with socket.create_connection(("8.8.8.8", 53), timeout=3):
+            with socket.create_connection(("api.telegram.org", 443), timeout=3):
                 return True
         except OSError:
-            time.sleep(3)
+            time.sleep(2)
     return False
 
+def boost_process(pid: int, max_cores: int = 2, niceness: int = -5) -> None:
+    """
+    Best-effort: pin pid to at most max_cores CPUs and raise its priority.
+    Linux only; raising priority needs root/CAP_SYS_NICE, failures are ignored.
+    """
+    if hasattr(os, "sched_setaffinity"):
+        try:
+            cores = set(sorted(os.sched_getaffinity(0))[:max_cores])
+            os.sched_setaffinity(pid, cores)
+        except OSError as e:
+            logger.debug(f"Could not set CPU affinity for {pid}: {e}")
+    if hasattr(os, "setpriority"):
+        try:
+            os.setpriority(os.PRIO_PROCESS, pid, niceness)
+        except OSError as e:
+            logger.debug(f"Could not set priority for {pid}: {e}")
+
+def run_streaming(cmd, cwd: str, stall_timeout_s: int = 300, tail_lines: int = 20) -> None:
+    """
+    Run cmd, echoing its combined stdout/stderr line by line.
+    Kills the child if it prints nothing for stall_timeout_s.
+    Raises CalledProcessError on non-zero exit and TimeoutExpired on stall;
+    the last tail_lines of output are logged on either failure.
+    """
+    proc = subprocess.Popen(
+        cmd, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+        bufsize=1, text=True,
+    )
+    # Applied from the parent: preexec_fn is unsafe once threads are running
+    boost_process(proc.pid)
+    # A reader thread keeps this portable (select() does not work on pipes on Windows)
+    lines: "queue.Queue" = queue.Queue()
+
+    def _reader():
+        for line in proc.stdout:
+            lines.put(line)
+        lines.put(None)
+
+    threading.Thread(target=_reader, name="sync-output", daemon=True).start()
+    tail = deque(maxlen=tail_lines)
+    while True:
+        try:
+            line = lines.get(timeout=stall_timeout_s)
+        except queue.Empty:
+            proc.kill()
+            proc.wait()
+            logger.error("Last sync output:\n" + "".join(tail))
+            raise subprocess.TimeoutExpired(cmd, stall_timeout_s)
+        if line is None:
+            break
+        tail.append(line)
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+    rc = proc.wait()
+    if rc != 0:
+        logger.error("Last sync output:\n" + "".join(tail))
+        raise subprocess.CalledProcessError(rc, cmd)
+
 def ensure_exec(path: str, what: str):
     if not os.path.isfile(path):
         logger.error(f"{what} not found: {path}")
@@ -133,8 +252,7 @@ def main():
     tg_send_with_name(notifier, start_msg)
 
     start_time = datetime.datetime.now()
-    logger.info("Starting 30-day boot sync subprocess...")
-    print(f"Running 30-day boot sync: {from_date} -> {to_date}", flush=True)
+    logger.info(f"Starting 30-day boot sync subprocess: {from_date} -> {to_date}")
 
     # Try once; on failure, wait and retry once
     attempts = 0
@@ -144,7 +262,7 @@ def main():
     while attempts < max_attempts:
         attempts += 1
         try:
-            subprocess.check_call(cmd, cwd=project_dir)
+            run_streaming(cmd, cwd=project_dir)
             # Success
             duration = datetime.datetime.now() - start_time
             ok_msg = (
@@ -154,10 +272,10 @@ def main():
                 f"✅ <b>Status:</b> Historical data sync completed"
             )
             logger.info("Boot sync finished successfully.")
-            print("Boot sync finished successfully.", flush=True)
             tg_send_with_name(notifier, ok_msg)
+            tg_flush()
             sys.exit(0)
-        except subprocess.CalledProcessError as e:
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
             last_err = e
             logger.error(f"Boot sync failed (attempt {attempts}/{max_attempts}): {e}")
             if attempts < max_attempts:
@@ -179,9 +297,9 @@ def main():
         f"❌ <b>Status:</b> Historical data sync failed\n"
         f"🔧 <b>Error:</b> {last_err}"
     )
-    print(f"Boot sync failed: {last_err}", flush=True)
     logger.error(f"Boot sync failed after {max_attempts} attempts: {last_err}")
     tg_send_with_name(notifier, err_msg)
+    tg_flush()
     sys.exit(1)
 
 
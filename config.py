@@ -0,0 +1,55 @@
+"""
+Shared access to config.json, plus small helpers used by main.py,
+sync_all.py and telegram_notifier.py.
+The file is read and parsed once per process; later calls return the cached dict.
+"""
+
+import json
+from functools import lru_cache
+from typing import Optional
+
+try:
+    import orjson
+except ImportError:  # fall back to stdlib json
+    orjson = None
+
+CONFIG_PATH = "config.json"
+
+
+@lru_cache(maxsize=None)
+def read_config(path: str = CONFIG_PATH) -> dict:
+    """Parse config.json (cached per path). Raises on missing/invalid files."""
+    with open(path, "rb") as f:
+        data = f.read()
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps_json(obj) -> bytes:
+    """Serialize obj to UTF-8 JSON bytes (orjson when available)."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":")).encode("utf-8")
+
+
+def retry_after_s(resp, cap: float = 120) -> Optional[float]:
+    """Seconds from a numeric Retry-After header (HTTP-dates are ignored)."""
+    try:
+        return min(cap, max(0.0, float(resp.headers.get("Retry-After", ""))))
+    except ValueError:
+        return None
+
+
+def is_retryable(status_code: int) -> bool:
+    """Only timeouts, throttling and server errors can succeed on a resend."""
+    return status_code in (408, 425, 429) or status_code >= 500
+
+
+def http2_available() -> bool:
+    """True when the h2 package is installed, so httpx clients can use HTTP/2."""
+    try:
+        import h2  # noqa: F401
+        return True
+    except ImportError:
+        return False
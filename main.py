@@ -1,33 +1,100 @@
 import asyncio
+import atexit
+import gzip
 import logging
-import json
+import multiprocessing.util
 import os
 import sys
-from multiprocessing import Process, Manager
-from multiprocessing.managers import BaseProxy
-from datetime import datetime, date, timedelta
+from multiprocessing import Event, Process, Queue, Value
+import queue
+import random
+import signal
+from datetime import datetime, date, timedelta, time as dtime
 import time
+from collections import namedtuple, OrderedDict
 from zk import ZK
 import httpx
 from pathlib import Path
-from socket import gethostbyname
+from urllib.parse import urlsplit
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, WatchedFileHandler
+try:
+    import zstandard
+except ImportError:  # zstd push compression is optional
+    zstandard = None
+try:
+    import psutil
+except ImportError:  # process tuning is optional
+    psutil = None
 import socket
 import subprocess
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from telegram_notifier import TelegramNotifier
+from config import dumps_json, http2_available, is_retryable, read_config, retry_after_s
 
 # =========================
 # Helpers: logging & setup
 # =========================
 
+_log_listener = None
+
+def _start_log_listener(logger, handlers):
+    """
+    Point logger at a fresh QueueHandler and start a QueueListener thread that
+    formats and writes to handlers, keeping file I/O off the caller's thread.
+    """
+    global _log_listener
+    log_q = queue.Queue(-1)
+    logger.handlers[:] = [QueueHandler(log_q)]
+    _log_listener = QueueListener(log_q, *handlers, respect_handler_level=True)
+    _log_listener.start()
+
+def _stop_log_listener():
+    """Flush queued records and stop the listener thread."""
+    global _log_listener
+    if _log_listener is not None:
+        _log_listener.stop()
+        _log_listener = None
+
+def _link_log(alias, target):
+    """
+    Make alias a symlink to target so the same log shows up in both places
+    without a second handler. A symlink (unlike a hardlink) follows rotation.
+    An existing regular file at alias is kept as alias.old.
+    Returns False when links are not possible (e.g. Windows without privilege).
+    """
+    try:
+        if alias.is_symlink():
+            if Path(os.readlink(alias)) == target:
+                return True
+            alias.unlink()
+        elif alias.exists():
+            old = alias.with_name(alias.name + ".old")
+            if old.exists():
+                return False
+            alias.rename(old)
+        alias.symlink_to(target)
+        return True
+    except (OSError, NotImplementedError):
+        return False
+
+def _running_as_windows_service():
+    """True when running as LocalSystem (USERNAME is SYSTEM or MACHINE$)."""
+    if os.name != "nt":
+        return False
+    user = os.environ.get("USERNAME", "")
+    return user.upper() == "SYSTEM" or user.endswith("$")
+
 def setup_logging():
     """Setup comprehensive logging for server/desktop-friendly environments."""
     log_dir = Path("logs")
     log_dir.mkdir(parents=True, exist_ok=True)
 
-    # Desktop logs only if Desktop exists (avoid headless errors)
+    # Desktop logs only if Desktop exists (avoid headless errors) and someone
+    # can see it: a service runs as LocalSystem, whose Desktop nobody opens
     desktop_dir = Path(os.path.expanduser("~/Desktop"))
     desktop_logs = None
-    if desktop_dir.exists():
+    if desktop_dir.exists() and not _running_as_windows_service():
         desktop_logs = desktop_dir / "AttendanceZTech Logs"
         desktop_logs.mkdir(exist_ok=True)
 
@@ -42,27 +109,57 @@ def setup_logging():
     logger = logging.getLogger('AttendanceZTech')
     logger.setLevel(logging.INFO)
     logger.handlers.clear()
-
-    fh = logging.FileHandler(main_log, encoding='utf-8')
-    fh.setLevel(logging.INFO)
+    handlers = []
+
+    # One real log file; the desktop and local copies are symlinks to it.
+    # Only the main process rotates it or (re)creates the links; spawned or
+    # forkserver workers re-run this with WatchedFileHandler so they follow
+    # its rotation. On Windows an open file cannot be renamed while workers
+    # hold it, so rotation is POSIX-only.
+    is_main = multiprocessing.parent_process() is None
+    if os.name == "nt":
+        fh = logging.FileHandler(main_log, encoding='utf-8')
+    elif is_main:
+        fh = RotatingFileHandler(main_log, maxBytes=50_000_000, backupCount=5, encoding='utf-8')
+    else:
+        fh = WatchedFileHandler(main_log, encoding='utf-8')
     fh.setFormatter(formatter)
-    logger.addHandler(fh)
+    handlers.append(fh)
+    main_log_abs = main_log.resolve()
+
+    def linked(alias):
+        if is_main:
+            return _link_log(alias, main_log_abs)
+        return alias.is_symlink()  # set up by the main process
 
-    if desktop_log:
+    if desktop_log and not linked(desktop_log):
         dh = logging.FileHandler(desktop_log, encoding='utf-8')
-        dh.setLevel(logging.INFO)
         dh.setFormatter(formatter)
-        logger.addHandler(dh)
+        handlers.append(dh)
 
     ch = logging.StreamHandler()
-    ch.setLevel(logging.INFO)
     ch.setFormatter(formatter)
-    logger.addHandler(ch)
-
-    local = logging.FileHandler("log.txt", encoding='utf-8')
-    local.setLevel(logging.INFO)
-    local.setFormatter(formatter)
-    logger.addHandler(local)
+    handlers.append(ch)
+
+    if not linked(Path("log.txt")):
+        local = logging.FileHandler("log.txt", encoding='utf-8')
+        local.setFormatter(formatter)
+        handlers.append(local)
+
+    _start_log_listener(logger, handlers)
+    atexit.register(_stop_log_listener)
+
+    # Threads do not survive fork: give each forked worker its own listener,
+    # flushed when the worker exits normally. Workers write the main log via
+    # WatchedFileHandler so they follow the parent's rotation instead of
+    # rotating it themselves. (Spawned workers re-run setup_logging and
+    # pick WatchedFileHandler above.)
+    def _after_fork_in_child(lg):
+        wfh = WatchedFileHandler(main_log, encoding='utf-8')
+        wfh.setFormatter(formatter)
+        _start_log_listener(lg, [wfh if h is fh else h for h in handlers])
+        multiprocessing.util.Finalize(None, _stop_log_listener, exitpriority=0)
+    multiprocessing.util.register_after_fork(logger, _after_fork_in_child)
 
     return logger
 
@@ -81,9 +178,7 @@ logger.info(
 
 def load_config():
     try:
-        with open("config.json", "r") as f:
-            cfg = json.load(f)
-        return cfg
+        return read_config()
     except Exception as e:
         logger.error(f"Failed to load config.json: {e}")
         sys.exit(1)
@@ -92,6 +187,11 @@ config = load_config()
 ENDPOINT = config["endpoint"]
 BUFFER_LIMIT = int(config["buffer_limit"])
 DEVICES = config["devices"]
+# "gzip"/"zstd" compress push bodies; only enable if the endpoint accepts Content-Encoding
+PUSH_COMPRESSION = str(config.get("push_compression", "none")).lower()
+# ATTZ_LOGLEVEL overrides config.json "log_level" (e.g. WARNING in production)
+LOG_LEVEL = (os.environ.get("ATTZ_LOGLEVEL") or config.get("log_level", "INFO")).upper()
+logger.setLevel(getattr(logging, LOG_LEVEL, logging.INFO))
 
 telegram_config = config.get("telegram", {})
 system_name = config.get("name", "Attendance System")
@@ -103,46 +203,115 @@ telegram_notifier = TelegramNotifier(
     system_name=system_name
 )
 
+# Capture workers are only restarted when dead or silent for this long.
+# live_capture yields at least every LIVE_CAPTURE_TICK_S, refreshing the heartbeat.
+SUPERVISE_INTERVAL_S = 30
+# Longest wait between restarts of a device that keeps failing
+RESTART_BACKOFF_MAX_S = 900
+LIVE_CAPTURE_TICK_S = 10
+HEARTBEAT_STALE_S = 120
+
+# Capture workers hand punches to the pusher in batches of up to this size,
+# or whatever is pending after CAPTURE_BATCH_MAX_AGE_S / an idle live_capture tick
+CAPTURE_BATCH_SIZE = 32
+CAPTURE_BATCH_MAX_AGE_S = 1.0
+
+# End-of-day task runs once per day at this local time
+EOD_TIME = dtime(23, 59)
+# Devices fetched (and pushed) concurrently during EoD
+EOD_MAX_WORKERS = 16
+# How long EoD waits for capture processes to run it on their own connection
+EOD_HANDOFF_TIMEOUT_S = 300
+
 logger.info(f"Configured devices: {len(DEVICES)} | Endpoint: {ENDPOINT} | Buffer limit: {BUFFER_LIMIT} | Telegram: {'ENABLED' if telegram_notifier.enabled else 'DISABLED'}")
 
 # =========================
 # Network readiness helpers
 # =========================
 
+def _endpoint_host_port():
+    """(host, port) of the push ENDPOINT; port defaults from the scheme."""
+    url = urlsplit(ENDPOINT)
+    return url.hostname, url.port or (443 if url.scheme == "https" else 80)
+
 def wait_for_network(max_wait_s=120):
     """
     Wait until DNS & outbound connectivity work.
+    One connect to the push endpoint per try covers both: a single name
+    lookup plus a TCP handshake to the one host the system cannot do
+    without (Telegram may be disabled or firewalled off).
+    Retries back off exponentially (2, 4, 8 ... capped at 30 s) so a long
+    outage does not keep hammering the resolver.
     """
-    start = time.time()
-    while time.time() - start < max_wait_s:
+    deadline = time.monotonic() + max_wait_s
+    attempt = 0
+    while time.monotonic() < deadline:
         try:
-            # DNS check (telegram and a public host)
-            gethostbyname("api.telegram.org")
-            gethostbyname("google.com")
-            # Outbound TCP check
-            with socket.create_connection(("8.8.8.8", 53), timeout=3):
+            with socket.create_connection(_endpoint_host_port(), timeout=3):
                 return True
         except OSError:
-            time.sleep(3)
+            delay = min(30, 2 * 2 ** attempt, max(0, deadline - time.monotonic()))
+            time.sleep(delay)
+            attempt += 1
     return False
 
 def any_device_ping_ok(hosts, max_wait_s=60):
     """
     Wait until at least one device answers ping (best-effort; do not fail hard).
+    All hosts are pinged at once and the round ends at the first reply, so
+    it takes at most ~1 s however many devices there are.
     """
-    start = time.time()
-    while time.time() - start < max_wait_s:
+    start = time.monotonic()
+    while time.monotonic() - start < max_wait_s:
+        procs = []
         for h in hosts:
             try:
-                rc = subprocess.call(["ping", "-c", "1", "-W", "1", h],
-                                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-                if rc == 0:
-                    return True
+                procs.append(subprocess.Popen(["ping", "-c", "1", "-W", "1", h],
+                                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
             except Exception:
                 pass
+        ok = False
+        round_deadline = time.monotonic() + 5
+        while procs and not ok and time.monotonic() < round_deadline:
+            for p in [p for p in procs if p.poll() is not None]:
+                ok = ok or p.returncode == 0
+                procs.remove(p)
+            if procs and not ok:
+                time.sleep(0.05)
+        for p in procs:  # still running: answered elsewhere or hung
+            p.kill()
+            p.wait()
+        if ok:
+            return True
         time.sleep(3)
     return False
 
+# TCP probe timeout used before opening a ZK session
+DEVICE_PROBE_TIMEOUT_S = 2
+
+def enable_tcp_keepalive(conn, idle_s=30, interval_s=10, count=3):
+    """
+    Best-effort: turn on TCP keepalive for a pyzk connection so a silently
+    dead device makes recv() fail within ~idle_s + interval_s * count
+    seconds. live_capture treats recv timeouts as idle ticks, so without
+    this a dead peer looks like a quiet device. No-op for UDP sessions.
+    """
+    sock = getattr(conn, "_ZK__sock", None)  # pyzk keeps it name-mangled
+    if sock is None or sock.type != socket.SOCK_STREAM:
+        return
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        if hasattr(socket, "TCP_KEEPIDLE"):
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPIDLE, idle_s)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPINTVL, interval_s)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_KEEPCNT, count)
+        elif hasattr(socket, "SIO_KEEPALIVE_VALS"):  # Windows
+            sock.ioctl(socket.SIO_KEEPALIVE_VALS, (1, idle_s * 1000, interval_s * 1000))
+        if hasattr(socket, "TCP_USER_TIMEOUT"):  # Linux: cap unacked sends too
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_USER_TIMEOUT, (idle_s + interval_s * count) * 1000)
+    except OSError as e:
+        logger.debug(f"Could not enable TCP keepalive: {e}")
+
 def host_port_reachable(host, port, timeout=3):
     try:
         with socket.create_connection((host, port), timeout=timeout):
@@ -154,19 +323,98 @@ def host_port_reachable(host, port, timeout=3):
 # Telegram (safe send)
 # =========================
 
+# Background sender: callers only enqueue, one thread per process does the
+# HTTPS round trips (and retries) so pushes and capture never wait on Telegram
+_TG_Q = None
+_TG_THREAD = None
+_TG_PID = None
+
+# Telegram rejects messages longer than 4096 characters
+TG_MAX_MESSAGE_LEN = 4096
+
+def _tg_worker(q):
+    """
+    Send queued messages. Whatever else is already waiting is folded into
+    the same message (up to TG_MAX_MESSAGE_LEN), so a burst costs one API
+    call instead of one per alert.
+    """
+    # Own kept-alive client: the push client's JSON defaults and 50 s
+    # timeout are not meant for Telegram, and only this thread uses it
+    client = httpx.Client(http2=http2_available(), timeout=httpx.Timeout(15.0, connect=5.0))
+    no_item = object()
+    pending = no_item
+    while True:
+        item = q.get() if pending is no_item else pending
+        pending = no_item
+        if item is None:
+            client.close()
+            return
+        html_text, retries, backoff_s = item
+        while True:
+            try:
+                nxt = q.get_nowait()
+            except queue.Empty:
+                break
+            if nxt is None or len(html_text) + 2 + len(nxt[0]) > TG_MAX_MESSAGE_LEN:
+                pending = nxt
+                break
+            html_text += "\n\n" + nxt[0]
+        for i in range(retries):
+            if telegram_notifier.send_message_with_client(client, html_text):
+                break
+            if i + 1 < retries:
+                delay = random.uniform(0, backoff_s * 2 ** i)
+                logger.error(f"Telegram send failed (attempt {i+1}/{retries}); retrying in {delay:.1f}s")
+                time.sleep(delay)
+        else:
+            logger.error(f"Telegram send failed after {retries} attempts")
+
 def tg_send_safe(html_text: str, retries=3, backoff_s=2):
     """
-    Send a Telegram message, but don't crash if network/DNS is not ready.
+    Queue a Telegram message for the background sender and return at once.
+    The sender keeps its own HTTP client, so repeated alerts reuse one TLS
+    connection to api.telegram.org.
     """
+    global _TG_Q, _TG_THREAD, _TG_PID
     if not telegram_notifier.enabled:
         return
-    for i in range(retries):
-        try:
-            telegram_notifier.send_message_sync(html_text)
-            return
-        except Exception as e:
-            logger.error(f"Telegram send failed (attempt {i+1}/{retries}): {e}")
-            time.sleep(backoff_s * (i + 1))
+    # Threads do not survive fork: each process starts its own sender
+    if _TG_PID != os.getpid():
+        _TG_Q = queue.Queue(maxsize=1000)
+        _TG_THREAD = threading.Thread(target=_tg_worker, args=(_TG_Q,), name="tg-sender", daemon=True)
+        _TG_THREAD.start()
+        _TG_PID = os.getpid()
+        # Flushes multiprocessing children at exit, before their log listener
+        # (exitpriority 0) stops. In the main process multiprocessing's atexit
+        # hook runs after the log listener has stopped, so main() flushes
+        # explicitly before returning and this call is then a no-op.
+        multiprocessing.util.Finalize(None, tg_flush, exitpriority=10)
+    try:
+        _TG_Q.put_nowait((html_text, retries, backoff_s))
+    except queue.Full:
+        logger.warning("⚠️ Telegram queue full; message dropped")
+
+def tg_flush(timeout_s: float = 10):
+    """
+    Wait (bounded) for this process's queued Telegram messages to be sent
+    and stop the sender; a later tg_send_safe starts a new one.
+    """
+    global _TG_THREAD, _TG_PID
+    if _TG_THREAD is None or _TG_PID != os.getpid():
+        return
+    try:
+        _TG_Q.put(None, timeout=timeout_s)
+    except queue.Full:
+        pass
+    _TG_THREAD.join(timeout_s)
+    if _TG_THREAD.is_alive():
+        logger.warning("⚠️ Telegram sender still busy at exit; remaining messages dropped")
+    _TG_THREAD = None
+    _TG_PID = None
+
+def now_str():
+    """Local time as 'YYYY-MM-DD HH:MM:SS' for notification messages."""
+    return time.strftime("%Y-%m-%d %H:%M:%S")
 
 def tg_send_with_name(message: str, retries=3, backoff_s=2):
     """
@@ -180,29 +428,54 @@ def tg_send_with_name(message: str, retries=3, backoff_s=2):
         message = message.replace("<b>", f"<b>{system_name} - ", 1)
     tg_send_safe(message, retries, backoff_s)
 
+# Last send time per rate-limited Telegram category (per process)
+_tg_last_sent = {}
+
+def tg_allow(key, per_s):
+    """
+    True at most once every per_s seconds for key; used so a fault storm
+    sends one alert per window instead of one per failed push.
+    """
+    now = time.monotonic()
+    last = _tg_last_sent.get(key)
+    if last is not None and now - last < per_s:
+        return False
+    _tg_last_sent[key] = now
+    return True
+
 # =========================
-# JSON/proxy conversion
+# JSON conversion
 # =========================
 
+# One captured punch; timestamp stays a datetime until serialization
+AttendanceRecord = namedtuple("AttendanceRecord", "device_id user_id timestamp status punch")
+
+def as_user_id(value):
+    """pyzk usually returns user_id as a digit string; skip int() if already int."""
+    return value if type(value) is int else int(value)
+
+def record_to_dict(rec):
+    return {
+        "device_id": rec.device_id,
+        "user_id": rec.user_id,
+        "timestamp": rec.timestamp.isoformat(sep=" ", timespec="seconds"),
+        "status": rec.status,
+        "punch": rec.punch,
+    }
+
 def _to_plain(obj):
     """
-    Deep-convert Manager proxies (ListProxy/DictProxy etc.), tuples, and datetimes
-    into plain JSON-serializable Python types.
+    Deep-convert AttendanceRecords, tuples, and datetimes into plain
+    JSON-serializable Python types.
     """
-    # Proxy -> list/dict/str
-    if isinstance(obj, BaseProxy):
-        # try list-like first
-        try:
-            obj = list(obj)
-        except Exception:
-            try:
-                obj = dict(obj)
-            except Exception:
-                return str(obj)
-
+    if isinstance(obj, AttendanceRecord):
+        return record_to_dict(obj)
     if isinstance(obj, dict):
         return {k: _to_plain(v) for k, v in obj.items()}
     if isinstance(obj, (list, tuple)):
+        # Fast path for push buffers: flat lists of records, no recursion
+        if obj and all(type(x) is AttendanceRecord for x in obj):
+            return [record_to_dict(x) for x in obj]
         return [_to_plain(x) for x in obj]
     if isinstance(obj, (datetime, date)):
         return obj.isoformat()
@@ -218,79 +491,261 @@ def log_device_status(device, status, details=""):
         msg += f" - {details}"
     logger.info(msg)
 
+# =========================
+# HTTP client (keep-alive)
+# =========================
+
+_HTTP = None
+_HTTP_PID = None
+# EoD threads can ask for the client at the same time; build it only once
+_HTTP_LOCK = threading.Lock()
+
+def get_http_client():
+    """
+    Return a persistent httpx.Client for pushes, one per process.
+    Reusing it keeps the TCP/TLS connection to ENDPOINT alive between pushes.
+    A forked child gets its own client instead of sharing the parent's sockets.
+    """
+    global _HTTP, _HTTP_PID
+    if _HTTP is not None and _HTTP_PID == os.getpid():
+        return _HTTP
+    with _HTTP_LOCK:
+        if _HTTP is None or _HTTP_PID != os.getpid():
+            _HTTP = httpx.Client(
+                http2=http2_available(),
+                headers={"Content-Type": "application/json"},
+                timeout=httpx.Timeout(50.0, connect=5.0),
+                # EoD threads push concurrently; keep one connection per worker alive
+                limits=httpx.Limits(max_keepalive_connections=EOD_MAX_WORKERS, keepalive_expiry=300),
+            )
+            _HTTP_PID = os.getpid()
+        return _HTTP
+
+def close_http_client():
+    global _HTTP
+    if _HTTP is not None and _HTTP_PID == os.getpid():
+        try:
+            _HTTP.close()
+        except Exception:
+            pass
+    _HTTP = None
+
+atexit.register(close_http_client)
+
 # =========================
 # Push to server
 # =========================
 
-def push_to_server(attendance_buffer, device_id=None):
+# Bodies smaller than this are sent as-is even with compression enabled
+GZIP_MIN_BYTES = 4096
+
+if PUSH_COMPRESSION == "zstd" and zstandard is None:
+    logger.warning("⚠️ push_compression is zstd but zstandard is not installed; using gzip")
+    PUSH_COMPRESSION = "gzip"
+
+# One ZstdCompressor per thread, reused across pushes (an instance must not
+# be shared by the concurrent EoD threads)
+_ZSTD = threading.local()
+
+def _compress_body(body: bytes) -> bytes:
+    if PUSH_COMPRESSION == "zstd":
+        cctx = getattr(_ZSTD, "cctx", None)
+        if cctx is None:
+            cctx = _ZSTD.cctx = zstandard.ZstdCompressor(level=3)
+        return cctx.compress(body)
+    return gzip.compress(body, compresslevel=1)
+
+def _post_json(body: bytes):
+    """
+    POST a JSON body to ENDPOINT, compressed when PUSH_COMPRESSION is "gzip"
+    or "zstd" and the body is at least GZIP_MIN_BYTES.
+    If the server answers 415, resend uncompressed and stop compressing.
+    """
+    global PUSH_COMPRESSION
+    client = get_http_client()
+    if PUSH_COMPRESSION in ("gzip", "zstd") and len(body) >= GZIP_MIN_BYTES:
+        resp = client.post(
+            ENDPOINT,
+            content=_compress_body(body),
+            headers={"Content-Type": "application/json", "Content-Encoding": PUSH_COMPRESSION},
+        )
+        if resp.status_code != 415:
+            return resp
+        logger.warning(f"⚠️ Endpoint rejected {PUSH_COMPRESSION} body (HTTP 415); sending uncompressed from now on")
+        PUSH_COMPRESSION = "none"
+    return client.post(ENDPOINT, content=body, headers={"Content-Type": "application/json"})
+
+# Retry/circuit-breaker settings for push_to_server
+PUSH_RETRIES = 3
+BREAKER_THRESHOLD = 5
+BREAKER_COOLDOWN_S = 60
+# At most one push-failure Telegram alert per this many seconds
+PUSH_FAIL_ALERT_INTERVAL_S = 60
+
+_push_failures = 0
+_push_cooldown_until = 0.0
+
+# Statuses meaning the server rejected the payload itself; resending the same
+# records can never succeed, so they are dropped instead of blocking the buffer
+PUSH_REJECTED_STATUSES = (400, 422)
+
+def push_to_server(attendance_buffer, device_id=None, notify=True):
     """
     Push attendance data to the server.
-    Accepts Manager().list() or a normal list.
-    - Deep-converts any proxies/nested proxies to plain types.
-    - Clears buffer in-place only on success.
+    - Deep-converts records to plain JSON types.
+    - Retries network errors, 429 and 5xx with exponential backoff + jitter.
+    - After BREAKER_THRESHOLD failed pushes in a row, skips pushing for
+      BREAKER_COOLDOWN_S (returns False; callers keep their buffer).
+    - On success removes exactly the pushed records from the front of the
+      buffer, so anything appended meanwhile is kept for the next push.
+    - On 400/422 the records are dropped from the buffer (logged at ERROR;
+      the device still holds them for sync_all.py) so one bad record cannot
+      block every later push.
+    - notify=False skips the per-push Telegram message (EoD sends a summary).
     """
-    # Materialize to a plain list of dicts (handles ListProxy + nested proxies)
-    records_plain = _to_plain(attendance_buffer)
+    global _push_failures, _push_cooldown_until
+
+    if time.monotonic() < _push_cooldown_until:
+        logger.debug("Push skipped: circuit breaker open")
+        return False
+
+    # Snapshot the first n records and materialize them to plain dicts
+    n = len(attendance_buffer)
+    records_plain = _to_plain(attendance_buffer[:n])
     if not records_plain:
         return True
 
     payload = {"Json": records_plain}
     record_count = len(records_plain)
+    body = dumps_json(payload)  # already plain JSON-ables
 
     logger.info(f"Pushing {record_count} records to {ENDPOINT}")
-    try:
-        with httpx.Client(timeout=50) as client:
-            resp = client.post(
-                ENDPOINT,
-                json=payload,  # already plain JSON-ables
-                headers={"Content-Type": "application/json"},
-            )
-        if resp.status_code == 200:
+    resp, error = None, None
+    for attempt in range(PUSH_RETRIES + 1):
+        try:
+            resp, error = _post_json(body), None
+        except Exception as e:
+            resp, error = None, e
+
+        if resp is not None and resp.status_code == 200:
+            _push_failures = 0
             logger.info(f"✅ Push success ({record_count} records)")
-            tg_send_with_name(
-                f"✅ <b>Data Push Success</b>\n\n"
-                f"🕒 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                f"🧾 <b>Records:</b> {record_count}\n"
-                f"✅ <b>Status:</b> Uploaded"
-            )
-            # Clear only after success
+            if notify:
+                tg_send_with_name(
+                    f"✅ <b>Data Push Success</b>\n\n"
+                    f"🕒 <b>Time:</b> {now_str()}\n"
+                    f"🧾 <b>Records:</b> {record_count}\n"
+                    f"✅ <b>Status:</b> Uploaded"
+                )
+            # Drop only what was sent, and only after success
             try:
-                if isinstance(attendance_buffer, BaseProxy):
-                    attendance_buffer[:] = []
-                else:
-                    attendance_buffer.clear()
+                del attendance_buffer[:n]
             except Exception:
                 pass
             return True
-        else:
+
+        if resp is not None:
             logger.error(f"❌ Push failed HTTP {resp.status_code}: {resp.text[:500]}")
-            tg_send_with_name(
-                f"❌ <b>Data Push Failed</b>\n\n"
-                f"🕒 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                f"🧾 <b>Records:</b> {record_count}\n"
-                f"❌ <b>Status:</b> HTTP {resp.status_code}"
-            )
-            return False
-    except Exception as e:
-        logger.error(f"❌ Push error: {e}")
+            if not is_retryable(resp.status_code):
+                break
+        else:
+            logger.error(f"❌ Push error: {error}")
+
+        if attempt < PUSH_RETRIES:
+            delay = min(30, 2 ** attempt) + random.random()
+            if resp is not None and resp.status_code in (429, 503):
+                delay = retry_after_s(resp) or delay
+            logger.info(f"Retrying push in {delay:.1f}s (attempt {attempt + 1}/{PUSH_RETRIES})...")
+            time.sleep(delay)
+
+    if resp is not None and resp.status_code in PUSH_REJECTED_STATUSES:
+        # Not an endpoint outage: leave the breaker alone
+        logger.error(f"❌ Dropping {record_count} records rejected by server: {body[:2000]!r}")
+        try:
+            del attendance_buffer[:n]
+        except Exception:
+            pass
+    else:
+        _push_failures += 1
+        if _push_failures >= BREAKER_THRESHOLD:
+            _push_cooldown_until = time.monotonic() + BREAKER_COOLDOWN_S
+            logger.warning(f"⚠️ {_push_failures} failed pushes in a row; pausing pushes for {BREAKER_COOLDOWN_S}s")
+
+    if notify and not tg_allow("push_fail", PUSH_FAIL_ALERT_INTERVAL_S):
+        logger.debug("Push failure alert suppressed (rate limited)")
+    elif notify and resp is not None:
+        tg_send_with_name(
+            f"❌ <b>Data Push Failed</b>\n\n"
+            f"🕒 <b>Time:</b> {now_str()}\n"
+            f"🧾 <b>Records:</b> {record_count}\n"
+            f"❌ <b>Status:</b> HTTP {resp.status_code}"
+        )
+    elif notify:
         tg_send_with_name(
             f"❌ <b>Data Push Error</b>\n\n"
-            f"🕒 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+            f"🕒 <b>Time:</b> {now_str()}\n"
             f"🧾 <b>Records:</b> {record_count}\n"
-            f"❌ <b>Error:</b> {str(e)}"
+            f"❌ <b>Error:</b> {str(error)}"
         )
-        return False
+    return False
 
 # =========================
 # End-of-day collection
 # =========================
 
+def push_todays_logs(conn, device):
+    """
+    Fetch current day's attendance logs over an open connection and push them.
+    pyzk has no date/cursor filter, so the device still sends full history;
+    today's records are picked out in one pass.
+    Returns (ok, record_count); ok is True when there was nothing to send or
+    the push succeeded. Telegram reporting is left to end_of_day_task.
+    """
+    device_id = device["device_id"]
+    logs = conn.get_attendance()
+    if not logs:
+        logger.info(f"ℹ️ No attendance logs found for device {device_id}")
+        return True, 0
+
+    today = date.today()
+    # Bounds computed once; comparing datetimes avoids a date() per record
+    day_start = datetime.combine(today, dtime.min)
+    day_end = day_start + timedelta(days=1)
+    todays_logs = [
+        log for log in logs
+        if day_start <= log.timestamp < day_end
+    ]
+    # Same compact records as live capture; push_to_server turns them into
+    # dicts only while serializing
+    attendance_data = [
+        AttendanceRecord(device_id, as_user_id(log.user_id), log.timestamp, log.status, log.punch)
+        for log in todays_logs
+    ]
+
+    logger.info(f"📊 EoD {device_id}: {len(attendance_data)} records for {today}")
+    if not attendance_data:
+        logger.info(f"ℹ️ No logs today for device {device_id}")
+        return True, 0
+
+    record_count = len(attendance_data)
+    ok = push_to_server(attendance_data, device_id, notify=False)
+    if ok:
+        logger.info(f"✅ EoD push OK for device {device_id}")
+    else:
+        logger.error(f"❌ EoD push failed for device {device_id}")
+    return ok, record_count
+
 def fetch_end_of_day_logs(device):
     """
-    Fetch current day's attendance logs from a device and push them.
-    Best-effort: logs errors but continues.
+    Fallback EoD for a device without a live capture process (or whose
+    worker did not complete the hand-off): open a fresh connection and run
+    push_todays_logs on it.
+    Best-effort: logs errors and returns (False, 0) instead of raising.
     """
     logger.info(f"🧹 Starting EoD fetch for device {device['device_id']}")
+    if not host_port_reachable(device["ip_address"], device["port"], timeout=DEVICE_PROBE_TIMEOUT_S):
+        log_device_status(device, "Unreachable", "Skipping EoD fetch")
+        return False, 0
 
     try:
         zk = ZK(
@@ -305,58 +760,15 @@ def fetch_end_of_day_logs(device):
         conn = zk.connect()
         if not conn:
             log_device_status(device, "Failed to connect", "None returned")
-            return
+            return False, 0
 
         try:
+            enable_tcp_keepalive(conn)
             conn.enable_device()
             log_device_status(device, "Connected", "Fetching logs...")
-            logs = conn.get_attendance()
-            if not logs:
-                logger.info(f"ℹ️ No attendance logs found for device {device['device_id']}")
-                return
-
-            today = datetime.now().strftime("%Y-%m-%d")
-            attendance_data = [
-                {
-                    "device_id": device["device_id"],
-                    "user_id": int(log.user_id),
-                    "timestamp": log.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                    "status": log.status,
-                    "punch": log.punch,
-                }
-                for log in logs
-                if log.timestamp.strftime("%Y-%m-%d") == today
-            ]
-
-            logger.info(f"📊 EoD {device['device_id']}: {len(attendance_data)} records for {today}")
-            if attendance_data:
-                ok = push_to_server(attendance_data, device['device_id'])
-                if ok:
-                    logger.info(f"✅ EoD push OK for device {device['device_id']}")
-                    tg_send_with_name(
-                        f"🧹 <b>End-of-Day Push</b>\n\n"
-                        f"🕒 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                        f"🖥️ <b>Device:</b> {device['device_id']}\n"
-                        f"🧾 <b>Records:</b> {len(attendance_data)}\n"
-                        f"✅ <b>Status:</b> Uploaded"
-                    )
-                else:
-                    logger.error(f"❌ EoD push failed for device {device['device_id']}")
-                    tg_send_with_name(
-                        f"❌ <b>EoD Push Failed</b>\n\n"
-                        f"🖥️ <b>Device:</b> {device['device_id']}\n"
-                        f"🧾 <b>Records:</b> {len(attendance_data)}"
-                    )
-            else:
-                logger.info(f"ℹ️ No logs today for device {device['device_id']}")
-                tg_send_with_name(
-                    f"ℹ️ <b>No EoD Data</b>\n\n"
-                    f"🖥️ <b>Device:</b> {device['device_id']}\n"
-                    f"🧾 <b>Records:</b> 0"
-                )
+            return push_todays_logs(conn, device)
         finally:
             try:
-                conn.enable_device()
                 conn.disconnect()
                 log_device_status(device, "Disconnected after EoD")
             except Exception as de:
@@ -364,32 +776,82 @@ def fetch_end_of_day_logs(device):
     except Exception as e:
         log_device_status(device, "Error during EoD fetch", str(e))
         logger.error(f"❌ EoD error {device['device_id']}: {e}")
+        return False, 0
 
-def end_of_day_task():
+# EoD hand-off states in CaptureWorker.eod_result; EOD_CONN_LOST means the
+# worker's device connection failed, so the parent retries on a fresh one
+EOD_PENDING, EOD_OK, EOD_FAILED, EOD_CONN_LOST = 0, 1, -1, -2
+
+def end_of_day_task(workers):
+    """
+    Run EoD for every device. Devices with a live capture process do it on
+    that process's open connection (no second ZK handshake, no two sessions
+    on one device); the rest, and any handed-off device whose worker dies,
+    loses its connection or does not answer in time (that worker is stopped
+    first), get a fresh connection in a thread pool.
+    Per-device outcomes go into one Telegram summary instead of a message each.
+    """
     logger.info("🧹 Starting EoD task for all devices...")
     tg_send_with_name(
         f"🧹 <b>Starting End-of-Day</b>\n\n"
-        f"🕒 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+        f"🕒 <b>Time:</b> {now_str()}\n"
         f"🖥️ <b>Devices:</b> {len(DEVICES)}"
     )
-    ok, fail = 0, 0
+    handed_off, fallback = [], []
     for d in DEVICES:
-        try:
-            fetch_end_of_day_logs(d)
-            ok += 1
-        except Exception as e:
-            fail += 1
-            logger.error(f"❌ EoD task error for device {d['device_id']}: {e}")
-            tg_send_with_name(
-                f"❌ <b>Device Error (EoD)</b>\n\n"
-                f"🖥️ <b>Device:</b> {d['device_id']}\n"
-                f"❌ <b>Error:</b> {str(e)}"
-            )
+        w = workers.get(d['device_id'])
+        if w is not None and w.process.is_alive():
+            w.eod_result.value = EOD_PENDING
+            w.eod_records.value = 0
+            w.eod_request.set()
+            handed_off.append(d)
+        else:
+            fallback.append(d)
+
+    results = {}  # device_id -> (ok, record_count)
+    # pyzk is blocking, so overlap the per-device network waits with threads
+    with ThreadPoolExecutor(max_workers=max(1, min(EOD_MAX_WORKERS, len(DEVICES)))) as ex:
+        futures = {d['device_id']: ex.submit(fetch_end_of_day_logs, d) for d in fallback}
+
+        for d in handed_off:
+            w = workers[d['device_id']]
+            # Each device gets the full timeout, counted from when we start
+            # waiting on it (its EoD has been running since the hand-off)
+            deadline = time.monotonic() + EOD_HANDOFF_TIMEOUT_S
+            while w.eod_result.value == EOD_PENDING and w.process.is_alive() and time.monotonic() < deadline:
+                time.sleep(0.5)
+            if w.eod_result.value in (EOD_PENDING, EOD_CONN_LOST):
+                # Worker died, lost its connection, never reached live capture,
+                # or timed out. Stop it first so the fresh connection is not a
+                # second session (or a second push) alongside it; the
+                # supervisor restarts it.
+                w.eod_request.clear()
+                logger.error(f"❌ EoD not completed by capture process for device {d['device_id']}; using a fresh connection")
+                stop_processes([w.process], [w.stop_request])
+                futures[d['device_id']] = ex.submit(fetch_end_of_day_logs, d)
+                continue
+            results[d['device_id']] = (w.eod_result.value == EOD_OK, w.eod_records.value)
+
+        for device_id, fut in futures.items():
+            try:
+                results[device_id] = fut.result()
+            except Exception as e:
+                results[device_id] = (False, 0)
+                logger.error(f"❌ EoD task error for device {device_id}: {e}")
+
+    lines = []
+    for d in DEVICES:
+        dev_ok, records = results[d['device_id']]
+        lines.append(f"{'✅' if dev_ok else '❌'} {d['device_id']}: {records} records")
+    ok = sum(1 for dev_ok, _ in results.values() if dev_ok)
+    fail = len(results) - ok
     tg_send_with_name(
         f"🧹 <b>EoD Complete</b>\n\n"
+        f"🕒 <b>Time:</b> {now_str()}\n"
         f"✅ <b>OK:</b> {ok}\n"
         f"❌ <b>Failed:</b> {fail}\n"
-        f"🖥️ <b>Total:</b> {len(DEVICES)}"
+        f"🖥️ <b>Total:</b> {len(DEVICES)}\n\n"
+        + "\n".join(lines)
     )
     logger.info("🧹 EoD task complete.")
 
@@ -397,17 +859,57 @@ def end_of_day_task():
 # Real-time capture
 # =========================
 
-def capture_real_time_logs(device, shared_buffer, periodic_flush_s=60):
+def tune_capture_process(index):
+    """
+    Best-effort: pin this capture process to one CPU (device i -> core i) and,
+    on Windows, raise it to high priority so live_capture reads are not
+    delayed by other work on the box. Failures are logged and ignored.
+    """
+    if psutil is None:
+        return
+    proc = psutil.Process()
+    try:
+        cpus = proc.cpu_affinity()
+        proc.cpu_affinity([cpus[index % len(cpus)]])
+    except (AttributeError, psutil.Error, OSError) as e:  # no affinity API on macOS
+        logger.debug(f"Could not set CPU affinity: {e}")
+    if os.name == "nt":
+        try:
+            proc.nice(psutil.HIGH_PRIORITY_CLASS)
+        except (psutil.Error, OSError) as e:
+            logger.debug(f"Could not raise priority: {e}")
+
+def _exit_on_sigterm(signum, frame):
+    raise SystemExit(0)
+
+def capture_real_time_logs(device, record_queue, last_seen=None, eod_request=None, eod_result=None,
+                           eod_records=None, stop_request=None, index=0):
     """
-    Process: connect to device and stream logs into shared_buffer.
-    Periodically flush to server even if BUFFER_LIMIT not reached.
+    Process: connect to device and stream logs into record_queue as lists of
+    AttendanceRecords (one queue message per micro-batch).
+    Pushing is done by the pusher process draining the queue.
+    last_seen (a shared double) is refreshed on every live_capture tick so
+    the supervisor can tell a stuck connection from a quiet device.
+    When eod_request is set, live capture is paused, push_todays_logs runs on
+    the same connection, its outcome goes to eod_result (record count to
+    eod_records), and capture resumes.
+    When stop_request is set, live capture ends at its next tick and the
+    process disconnects and exits.
     """
     device_id = device['device_id']
     ip_address = device['ip_address']
     port = device['port']
 
     logger.info(f"🔌 Starting RT capture for device {device_id} ({ip_address}:{port})")
-    last_flush = time.time()
+    tune_capture_process(index)
+    # stop_request is the normal way out; on POSIX a SIGTERM (terminate()
+    # after the stop timed out) also unwinds through the finally below, so
+    # the device session is closed instead of left for the device to time out
+    signal.signal(signal.SIGTERM, _exit_on_sigterm)
+    # Fail fast instead of sitting in a 50 s connect; the supervisor retries
+    if not host_port_reachable(ip_address, port, timeout=DEVICE_PROBE_TIMEOUT_S):
+        log_device_status(device, "Unreachable", "Skipping RT capture for now")
+        return
 
     try:
         zk = ZK(ip_address, port=port, timeout=50, password=device.get("password", 0))
@@ -417,7 +919,10 @@ def capture_real_time_logs(device, shared_buffer, periodic_flush_s=60):
             log_device_status(device, "Failed to connect", "None returned")
             return
 
+        batch = []
+        batch_started = 0.0
         try:
+            enable_tcp_keepalive(conn)
             conn.enable_device()
             log_device_status(device, "Connected", "Real-time capture active")
 
@@ -428,35 +933,68 @@ def capture_real_time_logs(device, shared_buffer, periodic_flush_s=60):
             except Exception:
                 logger.info(f"ℹ️ Device {device_id} connected (info unavailable)")
 
-            for attendance in conn.live_capture():
-                # live_capture can yield None; still tick periodic flush
-                now = time.time()
-
-                if attendance:
-                    log_entry = {
-                        "device_id": device_id,
-                        "user_id": int(attendance.user_id),
-                        "timestamp": attendance.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                        "status": attendance.status,
-                        "punch": attendance.punch,
-                    }
-                    logger.info(f"🕘 New attendance: user {attendance.user_id} @ {log_entry['timestamp']} (Dev {device_id})")
-                    shared_buffer.append(log_entry)
-
-                    # size-based flush
-                    if len(shared_buffer) >= BUFFER_LIMIT:
-                        logger.info(f"📤 Buffer ≥ {BUFFER_LIMIT}, pushing...")
-                        push_to_server(shared_buffer, device_id)
-
-                # time-based flush
-                if now - last_flush >= periodic_flush_s and len(shared_buffer) > 0:
-                    logger.info(f"⏱️ Periodic flush ({len(shared_buffer)} recs)")
-                    push_to_server(shared_buffer, device_id)
-                    last_flush = now
+            while True:
+                for attendance in conn.live_capture(new_timeout=LIVE_CAPTURE_TICK_S):
+                    # live_capture can yield None on timeout
+                    if last_seen is not None:
+                        last_seen.value = time.monotonic()
+                    if attendance:
+                        record = AttendanceRecord(
+                            device_id,
+                            as_user_id(attendance.user_id),
+                            attendance.timestamp,
+                            attendance.status,
+                            attendance.punch,
+                        )
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug(f"🕘 New attendance: user {attendance.user_id} @ {attendance.timestamp} (Dev {device_id})")
+                        if not batch:
+                            batch_started = time.monotonic()
+                        batch.append(record)
+
+                    # Flush on size, age, or an idle tick (attendance is None)
+                    if batch and (
+                        not attendance
+                        or len(batch) >= CAPTURE_BATCH_SIZE
+                        or time.monotonic() - batch_started >= CAPTURE_BATCH_MAX_AGE_S
+                    ):
+                        record_queue.put(batch)
+                        batch = []
+
+                    # Let live_capture leave its loop cleanly (it unregisters events)
+                    if (eod_request is not None and eod_request.is_set()) or (
+                        stop_request is not None and stop_request.is_set()
+                    ):
+                        conn.end_live_capture = True
+
+                if stop_request is not None and stop_request.is_set():
+                    break  # stop_processes asked us to exit
+                if eod_request is None or not eod_request.is_set():
+                    break  # live_capture ended on its own
+
+                if batch:
+                    record_queue.put(batch)
+                    batch = []
+                log_device_status(device, "Paused RT capture", "Running EoD on this connection")
+                try:
+                    ok, eod_records.value = push_todays_logs(conn, device)
+                except Exception as e:
+                    # push_to_server does not raise, so this is the device link;
+                    # exit (and disconnect) and let the parent use a fresh one
+                    logger.error(f"❌ EoD error {device_id}: {e}")
+                    eod_result.value = EOD_CONN_LOST
+                    eod_request.clear()
+                    raise
+                eod_result.value = EOD_OK if ok else EOD_FAILED
+                eod_request.clear()
+                if last_seen is not None:
+                    last_seen.value = time.monotonic()
+                log_device_status(device, "Resuming RT capture")
 
         finally:
+            if batch:
+                record_queue.put(batch)
             try:
-                conn.enable_device()
                 conn.disconnect()
                 log_device_status(device, "Disconnected from RT capture")
             except Exception as de:
@@ -465,38 +1003,237 @@ def capture_real_time_logs(device, shared_buffer, periodic_flush_s=60):
     except Exception as e:
         log_device_status(device, "Error during RT capture", str(e))
         logger.error(f"❌ RT capture error dev {device_id}: {e}")
+        if eod_request is not None and eod_request.is_set():
+            eod_result.value = EOD_CONN_LOST
+
+# =========================
+# Pusher
+# =========================
+
+# How many recent (device_id, user_id, timestamp) keys the pusher remembers
+DEDUP_MAX_KEYS = 50_000
+
+def seen_before(seen, record):
+    """
+    Return True if record's key is already in the LRU `seen`; otherwise add it
+    (evicting the oldest key past DEDUP_MAX_KEYS) and return False.
+    """
+    key = (record.device_id, record.user_id, record.timestamp)
+    if key in seen:
+        seen.move_to_end(key)
+        return True
+    seen[key] = None
+    if len(seen) > DEDUP_MAX_KEYS:
+        seen.popitem(last=False)
+    return False
+
+def push_from_queue(record_queue, flush_interval_s=5):
+    """
+    Process: drain record_queue (lists of AttendanceRecords) into a local
+    buffer and push it to the server when BUFFER_LIMIT is reached or
+    flush_interval_s has passed. Everything already queued is drained first,
+    so batches from all devices are coalesced into one POST.
+    A None item is the shutdown sentinel: flush what is pending and exit.
+    Records from a failed push stay buffered for the next attempt.
+    Punches seen recently (e.g. re-read after a capture restart) are dropped.
+    """
+    # Ctrl+C reaches the whole process group; the pusher waits for the
+    # shutdown sentinel from main() so it can do the final flush.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # main()'s SIGTERM handler is inherited on fork; terminate() must still
+    # stop a pusher that ignores the sentinel
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    logger.info("📤 Pusher started")
+    buffer = []
+    seen = OrderedDict()
+    last_flush = time.monotonic()
+    running = True
+    while running:
+        try:
+            # Block for the first batch, then take whatever else is waiting
+            item = record_queue.get(timeout=flush_interval_s)
+            while item is not None:
+                for record in item:
+                    if seen_before(seen, record):
+                        logger.debug(f"Duplicate punch dropped: {record}")
+                    else:
+                        buffer.append(record)
+                item = record_queue.get_nowait()
+            running = False
+        except queue.Empty:
+            pass
+        except (EOFError, OSError):
+            running = False
+
+        now = time.monotonic()
+        if len(buffer) >= BUFFER_LIMIT:
+            logger.info(f"📤 Buffer ≥ {BUFFER_LIMIT}, pushing...")
+            push_to_server(buffer)
+            last_flush = now
+        elif buffer and (now - last_flush >= flush_interval_s or not running):
+            logger.info(f"⏱️ Periodic flush ({len(buffer)} recs)")
+            push_to_server(buffer)
+            last_flush = now
+
+    if buffer:
+        logger.warning(f"⚠️ Pusher exiting with {len(buffer)} unpushed records")
+    logger.info("📤 Pusher stopped")
+
+def start_pusher(record_queue):
+    p = Process(target=push_from_queue, args=(record_queue,))
+    p.start()
+    logger.info(f"✅ Pusher process started (PID {p.pid})")
+    return p
+
+def stop_pusher(pusher, record_queue, join_timeout=60):
+    """Ask the pusher to flush and exit; terminate it if it does not."""
+    try:
+        # A dead pusher cannot drain the queue, so a blocking put could hang
+        if pusher.is_alive():
+            record_queue.put(None, timeout=join_timeout)
+            pusher.join(timeout=join_timeout)
+    except Exception:
+        pass
+    if pusher.is_alive():
+        logger.warning("⚠️ Pusher did not exit in time; terminating")
+        stop_processes([pusher])
 
 # =========================
 # Process orchestration
 # =========================
 
-def reconnect_devices(shared_buffer):
+# A capture process plus the shared state the parent uses to talk to it
+CaptureWorker = namedtuple("CaptureWorker", "process last_seen eod_request eod_result eod_records stop_request")
+
+def start_capture_process(device, record_queue, index=0):
+    """
+    Spawn the RT capture process for one device.
+    Returns a CaptureWorker; last_seen is the worker heartbeat (time.monotonic(),
+    which is system-wide so parent and child readings compare), eod_request /
+    eod_result / eod_records let end_of_day_task reuse the worker's connection,
+    and stop_request asks the worker to disconnect and exit.
+    """
+    logger.info(f"▶️ Starting process for device {device['device_id']}")
+    last_seen = Value('d', time.monotonic(), lock=False)
+    eod_request = Event()
+    eod_result = Value('i', EOD_PENDING, lock=False)
+    eod_records = Value('i', 0, lock=False)
+    stop_request = Event()
+    p = Process(
+        target=capture_real_time_logs,
+        args=(device, record_queue, last_seen, eod_request, eod_result, eod_records, stop_request, index),
+    )
+    p.start()
+    logger.info(f"✅ Process started dev {device['device_id']} (PID {p.pid})")
+    return CaptureWorker(p, last_seen, eod_request, eod_result, eod_records, stop_request)
+
+def reconnect_devices(record_queue):
     """
     Spawn one process per device for RT capture.
+    Returns {device_id: CaptureWorker}.
     """
     logger.info("🔁 Spawning RT capture processes...")
-    processes = []
-    for d in DEVICES:
-        logger.info(f"▶️ Starting process for device {d['device_id']}")
-        p = Process(target=capture_real_time_logs, args=(d, shared_buffer))
-        p.start()
-        processes.append(p)
-        logger.info(f"✅ Process started dev {d['device_id']} (PID {p.pid})")
-    logger.info(f"✅ All {len(processes)} device processes started")
-    return processes
-
-def stop_processes(processes, join_timeout=5):
+    workers = {}
+    for i, d in enumerate(DEVICES):
+        workers[d['device_id']] = start_capture_process(d, record_queue, i)
+    logger.info(f"✅ All {len(workers)} device processes started")
+    return workers
+
+# Restart backoff per device: device_id -> [delay_s, next_restart_at,
+# heartbeat value at the last restart]. Cleared once the heartbeat moves.
+_restart_backoff = {}
+
+def supervise_devices(workers, record_queue):
+    """
+    Restart only the capture processes that died or whose heartbeat is
+    older than HEARTBEAT_STALE_S; healthy connections are left alone.
+    Repeated restarts of one device back off from SUPERVISE_INTERVAL_S,
+    doubling up to RESTART_BACKOFF_MAX_S, so an offline device does not
+    get a new process every pass; the delay resets once its worker ticks.
+    """
+    now = time.monotonic()
+    for i, d in enumerate(DEVICES):
+        w = workers[d['device_id']]
+        p, last_seen = w.process, w.last_seen
+        backoff = _restart_backoff.get(d['device_id'])
+        if backoff is not None and last_seen.value > backoff[2]:
+            del _restart_backoff[d['device_id']]  # connected since the restart
+            backoff = None
+        if backoff is not None and now < backoff[1]:
+            continue
+        if not p.is_alive():
+            logger.warning(f"⚠️ Capture process dev {d['device_id']} exited (code {p.exitcode}); restarting")
+        elif now - last_seen.value > HEARTBEAT_STALE_S:
+            logger.warning(f"⚠️ Capture process dev {d['device_id']} silent for {int(now - last_seen.value)}s; restarting")
+            # Its live_capture is not ticking, so a stop request would go unseen
+            stop_processes([p])
+        else:
+            continue
+        delay = SUPERVISE_INTERVAL_S if backoff is None else min(backoff[0] * 2, RESTART_BACKOFF_MAX_S)
+        w = workers[d['device_id']] = start_capture_process(d, record_queue, i)
+        _restart_backoff[d['device_id']] = [delay, now + delay, w.last_seen.value]
+
+def stop_processes(processes, stop_events=(), join_timeout=5):
+    """
+    Set stop_events (capture workers leave live_capture at their next tick
+    and disconnect from the device) and wait up to LIVE_CAPTURE_TICK_S +
+    join_timeout; then terminate whatever is still running and kill what
+    is left after another join_timeout.
+    """
+    if stop_events:
+        for e in stop_events:
+            e.set()
+        deadline = time.monotonic() + LIVE_CAPTURE_TICK_S + join_timeout
+        for p in processes:
+            try:
+                p.join(timeout=max(0, deadline - time.monotonic()))
+            except Exception:
+                pass
     for p in processes:
+        if not p.is_alive():
+            continue
         try:
             p.terminate()
         except Exception:
             pass
+    deadline = time.monotonic() + join_timeout
     for p in processes:
         try:
-            p.join(timeout=join_timeout)
+            p.join(timeout=max(0, deadline - time.monotonic()))
+            if p.is_alive():
+                logger.warning(f"⚠️ Process {p.pid} did not exit after terminate; killing")
+                p.kill()
+                p.join(timeout=1)
         except Exception:
             pass
 
+# =========================
+# Scheduling
+# =========================
+
+# Set to make the main loop exit at its next wake-up
+shutdown_event = threading.Event()
+_shutdown_reason = None
+
+def _request_shutdown(signum, frame):
+    """SIGTERM (SIGBREAK on Windows) handler: stop the main loop cleanly."""
+    global _shutdown_reason
+    _shutdown_reason = signal.Signals(signum).name
+    shutdown_event.set()
+
+def install_shutdown_handlers():
+    """Route stop signals to shutdown_event (main process only)."""
+    for name in ("SIGTERM", "SIGBREAK"):
+        if hasattr(signal, name):
+            signal.signal(getattr(signal, name), _request_shutdown)
+
+def next_eod_after(now):
+    """Return the next EOD_TIME datetime strictly after now."""
+    target = datetime.combine(now.date(), EOD_TIME)
+    if now >= target:
+        target += timedelta(days=1)
+    return target
+
 # =========================
 # Main
 # =========================
@@ -517,81 +1254,91 @@ def main():
 
     tg_send_with_name(
         f"🚀 <b>Attendance ZTech Started</b>\n\n"
-        f"🕒 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
+        f"🕒 <b>Time:</b> {now_str()}\n"
         f"🖥️ <b>Devices:</b> {len(DEVICES)}\n"
         f"🌐 <b>Endpoint:</b> {ENDPOINT}\n"
         f"📦 <b>Buffer:</b> {BUFFER_LIMIT}"
     )
 
-    with Manager() as manager:
-        shared_buffer = manager.list()
-        logger.info("🧺 Shared buffer ready")
+    install_shutdown_handlers()
+    record_queue = Queue(maxsize=10000)
+    logger.info("🧺 Record queue ready")
 
-        processes = reconnect_devices(shared_buffer)
-        logger.info("🔗 Initial device connections done")
+    pusher = start_pusher(record_queue)
+    workers = reconnect_devices(record_queue)
+    logger.info("🔗 Initial device connections done")
 
-        last_reconnect = time.time()
-        last_eod_run_date = None  # ensure EoD runs once/day
+    last_supervise = time.monotonic()
+    next_eod = next_eod_after(datetime.now())
+    logger.info(f"🧹 Next EoD run at {next_eod}")
 
-        try:
-            logger.info("⏰ Entering main loop...")
-            while True:
-                now = datetime.now()
-
-                # Scheduled reconnect every 15 minutes
-                if time.time() - last_reconnect >= 15 * 60:
-                    logger.info("🔁 Scheduled 15-min reconnect...")
-                    stop_processes(processes)
-                    processes = reconnect_devices(shared_buffer)
-                    last_reconnect = time.time()
-
-                # End-of-day at ~23:59 once per day
-                if now.hour == 23 and now.minute == 59:
-                    if last_eod_run_date != date.today():
-                        logger.info("🧹 EoD window detected; running EoD task...")
-                        try:
-                            end_of_day_task()
-                        except Exception as e:
-                            logger.error(f"❌ EoD task error: {e}")
-                        last_eod_run_date = date.today()
-                        time.sleep(60)  # avoid multiple runs in the same minute
-
-                # Periodic flush safeguard in main (in case device processes died)
-                if len(shared_buffer) >= BUFFER_LIMIT:
-                    logger.info("📤 Main loop flush due to size")
-                    push_to_server(shared_buffer)
-
-                time.sleep(1)
-
-        except KeyboardInterrupt:
-            logger.info("⏹️ Terminated by user")
-            tg_send_with_name(
-                f"⏹️ <b>System Shutdown</b>\n\n"
-                f"🕒 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                f"📝 <b>Reason:</b> KeyboardInterrupt"
-            )
-        except Exception as e:
-            logger.error(f"❌ Unexpected error in main loop: {e}")
-            tg_send_with_name(
-                f"❌ <b>System Error</b>\n\n"
-                f"🕒 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                f"❌ <b>Error:</b> {str(e)}"
-            )
-        finally:
-            logger.info("🛑 Stopping device processes...")
-            stop_processes(processes)
-
-            # Final flush if anything pending
-            if len(shared_buffer) > 0:
-                logger.info(f"📤 Final flush of {len(shared_buffer)} records...")
-                push_to_server(shared_buffer)
-
-            logger.info("👋 Attendance ZTech stopped")
-            tg_send_with_name(
-                f"👋 <b>System Stopped</b>\n\n"
-                f"🕒 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-                f"🔌 <b>Status:</b> All processes terminated"
-            )
+    try:
+        logger.info("⏰ Entering main loop...")
+        while not shutdown_event.is_set():
+            # End-of-day once per day; skip if we woke up past the minute window
+            now = datetime.now()
+            if now >= next_eod:
+                if now - next_eod < timedelta(minutes=1):
+                    logger.info("🧹 EoD window detected; running EoD task...")
+                    try:
+                        end_of_day_task(workers)
+                    except Exception as e:
+                        logger.error(f"❌ EoD task error: {e}")
+                else:
+                    logger.warning(f"⚠️ Missed EoD window at {next_eod}; skipping")
+                next_eod = next_eod_after(datetime.now())
+
+            # Restart dead or stuck capture processes
+            if time.monotonic() - last_supervise >= SUPERVISE_INTERVAL_S:
+                supervise_devices(workers, record_queue)
+                last_supervise = time.monotonic()
+
+            # Keep the pusher alive; queued records survive a pusher restart
+            if not pusher.is_alive():
+                logger.warning(f"⚠️ Pusher exited (code {pusher.exitcode}); restarting")
+                pusher = start_pusher(record_queue)
+
+            # Sleep until the nearest deadline
+            until_eod = (next_eod - datetime.now()).total_seconds()
+            until_supervise = last_supervise + SUPERVISE_INTERVAL_S - time.monotonic()
+            shutdown_event.wait(max(1, min(until_eod, until_supervise)))
+
+        logger.info(f"⏹️ Shutdown requested ({_shutdown_reason})")
+        tg_send_with_name(
+            f"⏹️ <b>System Shutdown</b>\n\n"
+            f"🕒 <b>Time:</b> {now_str()}\n"
+            f"📝 <b>Reason:</b> {_shutdown_reason}"
+        )
+    except KeyboardInterrupt:
+        logger.info("⏹️ Terminated by user")
+        tg_send_with_name(
+            f"⏹️ <b>System Shutdown</b>\n\n"
+            f"🕒 <b>Time:</b> {now_str()}\n"
+            f"📝 <b>Reason:</b> KeyboardInterrupt"
+        )
+    except Exception as e:
+        logger.error(f"❌ Unexpected error in main loop: {e}")
+        tg_send_with_name(
+            f"❌ <b>System Error</b>\n\n"
+            f"🕒 <b>Time:</b> {now_str()}\n"
+            f"❌ <b>Error:</b> {str(e)}"
+        )
+    finally:
+        logger.info("🛑 Stopping device processes...")
+        stop_processes([w.process for w in workers.values()], [w.stop_request for w in workers.values()])
+
+        # Final flush of anything pending happens in the pusher
+        logger.info("📤 Stopping pusher (final flush)...")
+        stop_pusher(pusher, record_queue)
+
+        logger.info("👋 Attendance ZTech stopped")
+        tg_send_with_name(
+            f"👋 <b>System Stopped</b>\n\n"
+            f"🕒 <b>Time:</b> {now_str()}\n"
+            f"🔌 <b>Status:</b> All processes terminated"
+        )
+        # Send queued alerts while logging and the process are still intact
+        tg_flush()
 
 if __name__ == "__main__":
     try:
@@ -1,14 +1,17 @@
 #!/usr/bin/env python3
 import argparse
 import logging
-import json
 from datetime import datetime
-from typing import List, Iterable, Optional
+from typing import Iterable, Optional
+import random
 import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import httpx
 from zk import ZK
 
+from config import dumps_json, http2_available, is_retryable, read_config, retry_after_s
+
 # -----------------------------
 # CLI
 # -----------------------------
@@ -56,8 +59,7 @@ def parse_args():
 # Helpers
 # -----------------------------
 def load_config() -> dict:
-    with open("config.json", "r") as f:
-        return json.load(f)
+    return read_config()
 
 
 def setup_logging(level_name: Optional[str], config: dict):
@@ -83,38 +85,81 @@ def in_range(ts: datetime, start: Optional[datetime], end: Optional[datetime]) -
     return True
 
 
-def chunked(iterable: List[dict], size: int):
-    for i in range(0, len(iterable), size):
-        yield iterable[i : i + size]
+def to_record(device_id, log) -> dict:
+    uid = log.user_id
+    return {
+        "device_id": device_id,
+        "user_id": uid if type(uid) is int else int(uid),
+        "timestamp": log.timestamp.isoformat(sep=" ", timespec="seconds"),
+        "status": log.status,
+        "punch": log.punch,
+    }
+
+
+def payload_batches(device_id, logs: list, size: int):
+    """
+    Yield lists of at most `size` payload dicts, built batch by batch so only
+    one batch of dicts exists at a time. Malformed logs are skipped.
+    """
+    batch = []
+    for log in logs:
+        try:
+            batch.append(to_record(device_id, log))
+        except Exception as e:
+            logging.warning(f"[{device_id}] Skipping a malformed log: {e}")
+            continue
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def make_client(timeout: int = 60) -> httpx.Client:
+    """One client for the whole run, so batches reuse the TCP/TLS connection."""
+    return httpx.Client(
+        http2=http2_available(),
+        timeout=timeout,
+        limits=httpx.Limits(max_keepalive_connections=4),
+    )
 
 
-def push_batch(endpoint: str, batch: Iterable[dict], retries: int = 3, timeout: int = 60) -> bool:
+def push_batch(client: httpx.Client, endpoint: str, batch: Iterable[dict], retries: int = 3) -> bool:
     payload = {"Json": list(batch)}
+    body = dumps_json(payload)  # once, reused by every retry
     attempt = 0
     backoff = 2
     while attempt <= retries:
+        # Jitter keeps concurrent pushers from retrying in lockstep
+        delay = backoff * random.uniform(0.75, 1.25)
         try:
-            with httpx.Client(timeout=timeout) as client:
-                resp = client.post(endpoint, json=payload, headers={"Content-Type": "application/json"})
+            resp = client.post(endpoint, content=body, headers={"Content-Type": "application/json"})
             if resp.status_code == 200:
                 logging.info(f"Pushed {len(payload['Json'])} records successfully.")
                 return True
             else:
                 logging.error(f"Push failed (status {resp.status_code}): {resp.text}")
+                if not is_retryable(resp.status_code):
+                    return False
+                if resp.status_code in (429, 503):
+                    delay = retry_after_s(resp) or delay
         except Exception as e:
             logging.error(f"HTTP push error: {e}")
         attempt += 1
         if attempt <= retries:
-            logging.info(f"Retrying in {backoff}s (attempt {attempt}/{retries})...")
-            time.sleep(backoff)
+            logging.info(f"Retrying in {delay:.1f}s (attempt {attempt}/{retries})...")
+            time.sleep(delay)
             backoff = min(backoff * 2, 30)
     return False
 
 
-def collect_device_logs(device: dict) -> List[dict]:
+def collect_device_logs(
+    device: dict, start: Optional[datetime] = None, end: Optional[datetime] = None
+) -> list:
     """
     Fetch ALL logs from device using ZK SDK.
-    Return as list of dicts (unfiltered).
+    Return the raw pyzk Attendance objects within [start, end] when given;
+    payload dicts are built later, one batch at a time (payload_batches).
     """
     zk = ZK(
         device["ip_address"],
@@ -136,22 +181,12 @@ def collect_device_logs(device: dict) -> List[dict]:
             logging.info(f"[{device['device_id']}] No logs found.")
             return []
 
-        out = []
-        for log in logs:
-            try:
-                out.append(
-                    {
-                        "device_id": device["device_id"],
-                        "user_id": int(log.user_id),
-                        "timestamp": log.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-                        "status": log.status,
-                        "punch": log.punch,
-                    }
-                )
-            except Exception as e:
-                logging.warning(f"[{device['device_id']}] Skipping a malformed log: {e}")
-        logging.info(f"[{device['device_id']}] Retrieved {len(out)} logs.")
-        return out
+        logging.info(f"[{device['device_id']}] Retrieved {len(logs)} logs.")
+        if start or end:
+            out = [log for log in logs if in_range(log.timestamp, start, end)]
+            logging.info(f"[{device['device_id']}] Filtered logs count: {len(out)} ({len(logs) - len(out)} outside range)")
+            return out
+        return logs
 
     except Exception as e:
         logging.error(f"[{device['device_id']}] Error collecting logs: {e}")
@@ -159,7 +194,6 @@ def collect_device_logs(device: dict) -> List[dict]:
     finally:
         if conn is not None:
             try:
-                conn.enable_device()
                 conn.disconnect()
                 logging.info(f"[{device['device_id']}] Disconnected.")
             except Exception as e:
@@ -184,45 +218,31 @@ def main():
     chunk_size = max(1, args.chunk)
 
     total_pushed = 0
-    for device in devices:
-        # 1) Collect all logs
-        raw_logs = collect_device_logs(device)
-        if not raw_logs:
-            continue
-
-        # 2) Filter by date range if provided
-        if start_dt or end_dt:
-            filtered = []
-            for rec in raw_logs:
-                try:
-                    ts = datetime.strptime(rec["timestamp"], "%Y-%m-%d %H:%M:%S")
-                    if in_range(ts, start_dt, end_dt):
-                        filtered.append(rec)
-                except Exception as e:
-                    logging.warning(f"[{device['device_id']}] Timestamp parse error, skipping record: {e}")
-            logs = filtered
-            logging.info(f"[{device['device_id']}] Filtered logs count: {len(logs)}")
-        else:
-            logs = raw_logs
-
-        # 3) Sort by timestamp (optional but nice)
-        try:
-            logs.sort(key=lambda r: r["timestamp"])
-        except Exception:
-            pass
-
-        # 4) Push in batches
-        if not logs:
-            logging.info(f"[{device['device_id']}] Nothing to push after filtering.")
-            continue
-
-        for i, batch in enumerate(chunked(logs, chunk_size), start=1):
-            logging.info(f"[{device['device_id']}] Pushing batch {i} ({len(batch)} records)...")
-            ok = push_batch(endpoint, batch, retries=args.retries)
-            if not ok:
-                logging.error(f"[{device['device_id']}] Aborting further batches due to repeated push failures.")
-                break
-            total_pushed += len(batch)
+    # 1) Collect logs from all devices concurrently (blocking ZK socket I/O),
+    #    filtered by date range if provided; push each as soon as it is ready
+    with make_client() as client, ThreadPoolExecutor(max_workers=max(1, min(16, len(devices)))) as ex:
+        futures = {ex.submit(collect_device_logs, d, start_dt, end_dt): d for d in devices}
+        for fut in as_completed(futures):
+            device = futures[fut]
+            logs = fut.result()
+            if not logs:
+                logging.info(f"[{device['device_id']}] Nothing to push after filtering.")
+                continue
+
+            # 2) Sort by timestamp (optional but nice)
+            try:
+                logs.sort(key=lambda log: log.timestamp)
+            except Exception:
+                pass
+
+            # 3) Push in batches
+            for i, batch in enumerate(payload_batches(device["device_id"], logs, chunk_size), start=1):
+                logging.info(f"[{device['device_id']}] Pushing batch {i} ({len(batch)} records)...")
+                ok = push_batch(client, endpoint, batch, retries=args.retries)
+                if not ok:
+                    logging.error(f"[{device['device_id']}] Aborting further batches due to repeated push failures.")
+                    break
+                total_pushed += len(batch)
 
     logging.info(f"SYNC COMPLETE. Total records pushed: {total_pushed}")
 
@@ -1,9 +1,17 @@
 import asyncio
 import logging
+import os
+import threading
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List
 import httpx
-import json
+from config import dumps_json, http2_available
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+def _now_str() -> str:
+    """Local time as 'YYYY-MM-DD HH:MM:SS' for message bodies."""
+    return datetime.now().isoformat(sep=" ", timespec="seconds")
 
 class TelegramNotifier:
     """
@@ -17,7 +25,17 @@ class TelegramNotifier:
         self.notification_settings = notification_settings or {}
         self.system_name = system_name
         self.base_url = f"https://api.telegram.org/bot{bot_token}"
+        self.send_url = f"{self.base_url}/sendMessage"
         self.logger = logging.getLogger('AttendanceZTech.Telegram')
+        # Kept-alive client for send_message; an AsyncClient belongs to the
+        # event loop it was first used on, so it is remembered with its loop
+        self._client: Optional[httpx.AsyncClient] = None
+        self._client_loop: Optional[asyncio.AbstractEventLoop] = None
+        # Background loop for send_message_sync, started on first use
+        # (per process: the loop thread does not survive fork)
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_pid: Optional[int] = None
+        self._loop_lock = threading.Lock()
         
     def is_notification_enabled(self, notification_type: str) -> bool:
         """Check if a specific notification type is enabled."""
@@ -40,37 +58,118 @@ class TelegramNotifier:
             return False
             
         try:
-            url = f"{self.base_url}/sendMessage"
             payload = {
                 "chat_id": self.chat_id,
                 "text": message,
                 "parse_mode": parse_mode
             }
             
-            async with httpx.AsyncClient(timeout=10.0) as client:
-                response = await client.post(url, json=payload)
-                
-                if response.status_code == 200:
-                    self.logger.debug("Telegram message sent successfully")
-                    return True
-                else:
-                    self.logger.error(f"Failed to send Telegram message. Status: {response.status_code}, Response: {response.text}")
-                    return False
+            response = await self._async_client().post(self.send_url, content=dumps_json(payload), headers=_JSON_HEADERS)
+            
+            if response.status_code == 200:
+                self.logger.debug("Telegram message sent successfully")
+                return True
+            else:
+                self.logger.error(f"Failed to send Telegram message. Status: {response.status_code}, Response: {response.text}")
+                return False
                     
         except Exception as e:
             self.logger.error(f"Error sending Telegram message: {e}")
             return False
     
-    def send_message_sync(self, message: str, parse_mode: str = "HTML") -> bool:
+    def _async_client(self) -> httpx.AsyncClient:
+        """Return the persistent AsyncClient for the running event loop."""
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client_loop is not loop:
+            # Small pool: Telegram closes surplus connections anyway
+            self._client = httpx.AsyncClient(
+                timeout=10.0, http2=http2_available(), limits=httpx.Limits(max_connections=4)
+            )
+            self._client_loop = loop
+        return self._client
+    
+    async def aclose(self) -> None:
+        """Close the persistent client (call from the loop that used it)."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            self._client_loop = None
+    
+    def send_message_with_client(self, client: httpx.Client, message: str, parse_mode: str = "HTML") -> bool:
+        """
+        Send a message using a caller-owned httpx.Client, so repeated sends
+        reuse one kept-alive connection to api.telegram.org.
+        
+        Returns:
+            bool: True if message was sent successfully, False otherwise
+        """
+        if not self.enabled or not self.bot_token or not self.chat_id:
+            return False
+            
+        try:
+            payload = {
+                "chat_id": self.chat_id,
+                "text": message,
+                "parse_mode": parse_mode
+            }
+            response = client.post(self.send_url, content=dumps_json(payload), headers=_JSON_HEADERS)
+            
+            if response.status_code == 200:
+                self.logger.debug("Telegram message sent successfully")
+                return True
+            else:
+                self.logger.error(f"Failed to send Telegram message. Status: {response.status_code}, Response: {response.text}")
+                return False
+                
+        except Exception as e:
+            self.logger.error(f"Error sending Telegram message: {e}")
+            return False
+    
+    def _background_loop(self) -> asyncio.AbstractEventLoop:
+        """Return this process's long-lived event loop, starting it if needed."""
+        with self._loop_lock:
+            if self._loop is None or self._loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="telegram-loop", daemon=True).start()
+                self._loop = loop
+                self._loop_pid = os.getpid()
+            return self._loop
+    
+    def send_message_sync(self, message: str, parse_mode: str = "HTML", timeout: float = 15.0) -> bool:
         """
         Synchronous wrapper for send_message.
+        Runs it on a persistent background loop, so the AsyncClient (and its
+        connection) is reused and this works from any thread, including one
+        that already runs an event loop.
         """
+        future = asyncio.run_coroutine_threadsafe(
+            self.send_message(message, parse_mode), self._background_loop()
+        )
         try:
-            loop = asyncio.get_event_loop()
-            return loop.run_until_complete(self.send_message(message, parse_mode))
-        except RuntimeError:
-            # If no event loop is running, create a new one
-            return asyncio.run(self.send_message(message, parse_mode))
+            return future.result(timeout)
+        except Exception as e:
+            future.cancel()
+            self.logger.error(f"Error sending Telegram message: {e}")
+            return False
+    
+    def send_messages_sync(self, messages: List[str], parse_mode: str = "HTML", timeout: float = 30.0) -> List[bool]:
+        """
+        Send several messages concurrently on the background loop, sharing
+        the same kept-alive client as send_message_sync.
+        
+        Returns:
+            List[bool]: One result per message, in order
+        """
+        async def send_all():
+            return await asyncio.gather(*(self.send_message(m, parse_mode) for m in messages))
+        
+        future = asyncio.run_coroutine_threadsafe(send_all(), self._background_loop())
+        try:
+            return future.result(timeout)
+        except Exception as e:
+            future.cancel()
+            self.logger.error(f"Error sending Telegram messages: {e}")
+            return [False] * len(messages)
     
     async def send_startup_notification(self, device_count: int, endpoint: str) -> bool:
         """Send startup notification."""
@@ -80,7 +179,7 @@ class TelegramNotifier:
         message = f"""
 🚀 <b>{self.system_name} Started</b>
 
-📅 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+📅 <b>Time:</b> {_now_str()}
 📱 <b>Devices:</b> {device_count}
 🌐 <b>Endpoint:</b> {endpoint}
 
@@ -99,7 +198,7 @@ class TelegramNotifier:
         message = f"""
 🌅 <b>{self.system_name} - End-of-Day Data Push</b>
 
-📅 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+📅 <b>Time:</b> {_now_str()}
 📱 <b>Device:</b> {device_id}
 📊 <b>Records:</b> {record_count}
 {status_emoji} <b>Status:</b> {status_text} push data to server
@@ -118,7 +217,7 @@ class TelegramNotifier:
         message = f"""
 📦 <b>{self.system_name} - Data Push Notification</b>
 
-📅 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+📅 <b>Time:</b> {_now_str()}
 📊 <b>Records:</b> {record_count}{device_info}
 {status_emoji} <b>Status:</b> {status_text} push data to server
         """
@@ -134,7 +233,7 @@ class TelegramNotifier:
         message = f"""
 ❌ <b>{self.system_name} - Error Alert</b>
 
-📅 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+📅 <b>Time:</b> {_now_str()}
 🔧 <b>Type:</b> {error_type}{device_info}
 📝 <b>Message:</b> {error_message}
         """
@@ -150,7 +249,7 @@ class TelegramNotifier:
         message = f"""
 📱 <b>{self.system_name} - Device Status Update</b>
 
-📅 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}
+📅 <b>Time:</b> {_now_str()}
 🔧 <b>Device:</b> {device_id}
 {status_emoji} <b>Status:</b> {status}
 {f"📝 <b>Details:</b> {details}" if details else ""}
@@ -187,5 +286,5 @@ class TelegramNotifier:
         if not self.enabled or not self.bot_token or not self.chat_id:
             return False
             
-        test_message = f"🧪 <b>{self.system_name} - Test Message</b>\n\n📅 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n✅ Telegram bot is working correctly!"
+        test_message = f"🧪 <b>{self.system_name} - Test Message</b>\n\n📅 {_now_str()}\n✅ Telegram bot is working correctly!"
         return self.send_message_sync(test_message)
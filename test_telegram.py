@@ -4,21 +4,55 @@ Test script for Telegram bot integration.
 Run this script to test if your Telegram bot is working correctly.
 """
 
-import json
 import sys
+import time
 from datetime import datetime
 from telegram_notifier import TelegramNotifier
+from config import read_config
+
+# (label, title, details) of each test notification; only the header varies
+TEST_NOTIFICATIONS = [
+    ("Startup notification", "System Startup",
+     "📱 <b>Devices:</b> 3\n"
+     "🌐 <b>Endpoint:</b> https://test.example.com\n"
+     "✅ <b>Status:</b> Test startup notification"),
+    ("Data push notification", "Data Push",
+     "📊 <b>Records:</b> 5 (Device: 1)\n"
+     "✅ <b>Status:</b> Test data push successful"),
+    ("End-of-day notification", "End-of-Day",
+     "📱 <b>Device:</b> 1\n"
+     "📊 <b>Records:</b> 10\n"
+     "✅ <b>Status:</b> Test end-of-day successful"),
+    ("Error notification", "Error Alert",
+     "🔧 <b>Type:</b> Test Error (Device: 1)\n"
+     "📝 <b>Message:</b> This is a test error message"),
+    ("Device status notification", "Device Status",
+     "🔧 <b>Device:</b> 1\n"
+     "✅ <b>Status:</b> Connected\n"
+     "📝 <b>Details:</b> Test connection successful"),
+]
+TEST_HEADER = "🧪 <b>Test: %s - %s</b>\n\n📅 <b>Time:</b> %s\n"
 
 def load_config():
     """Load configuration from config.json"""
     try:
-        with open("config.json", "r") as config_file:
-            config = json.load(config_file)
-        return config
+        return read_config()
     except Exception as e:
         print(f"❌ Failed to load config.json: {e}")
         sys.exit(1)
 
+def send_with_retry(notifier, messages, tries=3, base=0.1):
+    """Send messages, resending only the failed ones after 0.1s, 0.4s, ..."""
+    results = notifier.send_messages_sync(messages)
+    for attempt in range(1, tries):
+        failed = [i for i, ok in enumerate(results) if not ok]
+        if not failed:
+            break
+        time.sleep(base * 4 ** (attempt - 1))
+        for i, ok in zip(failed, notifier.send_messages_sync([messages[i] for i in failed])):
+            results[i] = ok
+    return results
+
 def test_telegram_bot():
     """Test the Telegram bot functionality"""
     print("🧪 Testing Telegram Bot Integration...")
@@ -62,80 +96,33 @@ def test_telegram_bot():
     print(f"💬 Chat ID: {chat_id}")
     print()
     
-    # Test connection
-    print("🔄 Testing connection...")
-    if telegram_notifier.test_connection():
-        print("✅ Connection test successful!")
-    else:
-        print("❌ Connection test failed!")
-        return False
-    
-    print()
+    # The test notifications double as the connection test: a successful
+    # send proves the token, chat ID and HTML formatting all work
     print("📤 Sending test notifications...")
     
-    # Test different notification types using proper methods
-    print("   Testing startup notification...")
-    success = telegram_notifier.send_message_sync(
-        f"🧪 <b>Test: {telegram_notifier.system_name} - System Startup</b>\n\n"
-        f"📅 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-        f"📱 <b>Devices:</b> 3\n"
-        f"🌐 <b>Endpoint:</b> https://test.example.com\n"
-        f"✅ <b>Status:</b> Test startup notification"
-    )
-    if success:
-        print("   ✅ Startup notification sent successfully")
-    else:
-        print("   ❌ Startup notification failed to send")
-    
-    print("   Testing data push notification...")
-    success = telegram_notifier.send_message_sync(
-        f"🧪 <b>Test: {telegram_notifier.system_name} - Data Push</b>\n\n"
-        f"📅 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-        f"📊 <b>Records:</b> 5 (Device: 1)\n"
-        f"✅ <b>Status:</b> Test data push successful"
-    )
-    if success:
-        print("   ✅ Data push notification sent successfully")
-    else:
-        print("   ❌ Data push notification failed to send")
-    
-    print("   Testing end-of-day notification...")
-    success = telegram_notifier.send_message_sync(
-        f"🧪 <b>Test: {telegram_notifier.system_name} - End-of-Day</b>\n\n"
-        f"📅 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-        f"📱 <b>Device:</b> 1\n"
-        f"📊 <b>Records:</b> 10\n"
-        f"✅ <b>Status:</b> Test end-of-day successful"
-    )
-    if success:
-        print("   ✅ End-of-day notification sent successfully")
-    else:
-        print("   ❌ End-of-day notification failed to send")
-    
-    print("   Testing error notification...")
-    success = telegram_notifier.send_message_sync(
-        f"🧪 <b>Test: {telegram_notifier.system_name} - Error Alert</b>\n\n"
-        f"📅 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-        f"🔧 <b>Type:</b> Test Error (Device: 1)\n"
-        f"📝 <b>Message:</b> This is a test error message"
-    )
-    if success:
-        print("   ✅ Error notification sent successfully")
-    else:
-        print("   ❌ Error notification failed to send")
+    # Test different notification types; one timestamp for the whole run
+    now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    # One combined message proves the pipeline as well as five would; split
+    # only if it would exceed Telegram's 4096-character limit
+    separator = "\n\n━━━━━━━━━━\n\n"
+    parts = []
+    prepared = []
+    for label, title, details in TEST_NOTIFICATIONS:
+        message = TEST_HEADER % (telegram_notifier.system_name, title, now_str) + details
+        if parts and len(parts[-1]) + len(separator) + len(message) <= 4000:
+            parts[-1] += separator + message
+        else:
+            parts.append(message)
+        prepared.append(f"   📝 {label} prepared")
+    print("\n".join(prepared), flush=True)
     
-    print("   Testing device status notification...")
-    success = telegram_notifier.send_message_sync(
-        f"🧪 <b>Test: {telegram_notifier.system_name} - Device Status</b>\n\n"
-        f"📅 <b>Time:</b> {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-        f"🔧 <b>Device:</b> 1\n"
-        f"✅ <b>Status:</b> Connected\n"
-        f"📝 <b>Details:</b> Test connection successful"
-    )
-    if success:
-        print("   ✅ Device status notification sent successfully")
+    results = send_with_retry(telegram_notifier, parts)
+    if all(results):
+        print(f"   ✅ Test notifications sent successfully ({len(parts)} message(s))")
     else:
-        print("   ❌ Device status notification failed to send")
+        print(f"   ❌ {results.count(False)} of {len(parts)} test message(s) failed to send")
+        return False
     
     print()
     print("🎉 Telegram bot test completed!")